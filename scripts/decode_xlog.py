@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""xlog 解码脚本（纯 Python 备用实现）。
+
+当 rxd 解码器不可用时（平台不支持、二进制缺失等），可以用本脚本直接解码
+Tencent Mars 格式（V2/V3）以及 ZIP 格式的 xlog 文件：
+
+    python3 scripts/decode_xlog.py <xlog 文件或目录>
+
+解码结果与 rxd 一致，输出为同目录下的 xxx_.log 文件。
+移植自 Tencent Mars 项目的 decode_mars_nocrypt_log_file.py。
+"""
+
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import traceback
+import zipfile
+import zlib
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# zstandard 为可选依赖，缺失时 V3 的 zstd 帧退化为跳过
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Mars xlog 各格式的起始 magic
+MAGIC_NO_COMPRESS_START = 0x03
+MAGIC_NO_COMPRESS_START1 = 0x06
+MAGIC_NO_COMPRESS_NO_CRYPT_START = 0x08
+MAGIC_COMPRESS_START = 0x04
+MAGIC_COMPRESS_START1 = 0x05
+MAGIC_COMPRESS_START2 = 0x07
+MAGIC_COMPRESS_NO_CRYPT_START = 0x09
+MAGIC_SYNC_ZSTD_START = 0x0A
+MAGIC_SYNC_NO_CRYPT_ZSTD_START = 0x0B
+MAGIC_ASYNC_ZSTD_START = 0x0C
+MAGIC_ASYNC_NO_CRYPT_ZSTD_START = 0x0D
+
+MAGIC_END = 0x00
+
+MAGIC_VALUES = [
+    MAGIC_NO_COMPRESS_START, MAGIC_NO_COMPRESS_START1,
+    MAGIC_NO_COMPRESS_NO_CRYPT_START, MAGIC_COMPRESS_START,
+    MAGIC_COMPRESS_START1, MAGIC_COMPRESS_START2,
+    MAGIC_COMPRESS_NO_CRYPT_START, MAGIC_SYNC_ZSTD_START,
+    MAGIC_SYNC_NO_CRYPT_ZSTD_START, MAGIC_ASYNC_ZSTD_START,
+    MAGIC_ASYNC_NO_CRYPT_ZSTD_START,
+]
+
+_MAGIC_SET = frozenset(MAGIC_VALUES)
+# magic 字节的字符类正则：sre 对字符类做 C 层的范围判断，直接在
+# mmap/memoryview 上扫描，不需要先复制出 bytes
+_MAGIC_RE = re.compile(b"[%s]" % re.escape(bytes(sorted(_MAGIC_SET))))
+
+# magic -> crypt key 长度（0 表示非法 magic），单次索引取代 if/elif 级联
+_KEY4_MAGICS = frozenset((
+    MAGIC_NO_COMPRESS_START, MAGIC_COMPRESS_START, MAGIC_COMPRESS_START1))
+_CRYPT_KEY_LEN_TABLE = bytes(
+    4 if i in _KEY4_MAGICS else 64 if i in _MAGIC_SET else 0
+    for i in range(256))
+
+# 预编译的小端整数解析器；同时显式声明 "<" 字节序（原生序在大端机上是错的）
+_U32 = struct.Struct("<I")
+_U16 = struct.Struct("<H")
+
+# 单次 decompress 调用是无状态的，一个解压器可以跨帧复用
+_ZSTD_DECOMPRESSOR = zstandard.ZstdDecompressor() if zstandard else None
+
+# 解压失败的完整堆栈只打印前几次；损坏文件上逐帧做栈回溯开销很大
+_decompress_err_count = 0
+_DECOMPRESS_ERR_LIMIT = 5
+
+# 诊断信息直接用 bytes 模板做 % 格式化，省去逐条 str 构造 + encode
+_ERR_DECODE = b"[F]decode_xlog.py decode error len=%d, result:%s \n"
+_ERR_MAGIC = b"[F]decode_xlog.py decode error magic:%d \n"
+_ERR_SEQ_MISSING = b"[F]decode_xlog.py log seq:%d-%d is missing\n"
+_ERR_DECOMPRESS = b"[F]decode_xlog.py decompress err, %s\n"
+
+
+class FrameWriter(object):
+    """按文件顺序写出解码结果，允许压缩帧在后台线程解压。
+
+    zlib 在 C 层解压时会释放 GIL：把整帧解压提交到工作线程后，
+    主线程可以继续校验下一帧的帧头，两者得以重叠。写入顺序由一个
+    先进先出队列保证——队首是普通 bytes 或已完成的 future 时立即
+    落盘，否则暂存。
+    """
+
+    __slots__ = ("_fpout", "_pool", "_pending")
+
+    def __init__(self, fpout, pool):
+        self._fpout = fpout
+        self._pool = pool
+        self._pending = deque()
+
+    def write(self, data):
+        if self._pending:
+            self._pending.append(data)
+        else:
+            self._fpout.write(data)
+
+    def submit(self, func, *args):
+        """把 func(*args) 交给工作线程执行，结果按提交顺序写出。"""
+        self._pending.append(self._pool.submit(func, *args))
+        self._drain(block=False)
+
+    def _drain(self, block):
+        pending = self._pending
+        while pending:
+            item = pending[0]
+            if isinstance(item, Future):
+                if not (block or item.done()):
+                    break
+                item = item.result()
+            pending.popleft()
+            self._fpout.write(item)
+
+    def flush(self):
+        """等待所有未完成的解压任务并写出剩余数据。"""
+        self._drain(block=True)
+
+
+class DecodeState(object):
+    """单个 xlog 文件的解码状态。
+
+    原先 lastseq 是模块级全局变量：CPython 里 LOAD_GLOBAL 比 __slots__
+    属性访问慢，且隐式共享状态会妨碍并行解码。现在每个文件一个实例，
+    状态的作用域一目了然。
+    """
+
+    __slots__ = ("lastseq",)
+
+    def __init__(self):
+        self.lastseq = 0
+
+
+def print_utf8(message):
+    print(message)
+
+
+def _inflate_frame(payload):
+    """解压一个完整压缩帧（在工作线程中运行），异常转为诊断文本返回。"""
+    try:
+        try:
+            # 完整的 raw deflate 流走一次性 C 接口，省掉 decompressobj
+            # 包装对象的构造
+            return zlib.decompress(payload, -zlib.MAX_WBITS)
+        except zlib.error:
+            # Z_SYNC_FLUSH 写出的帧没有流结束标记，退回增量接口
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload)
+    except Exception as e:
+        return _ERR_DECOMPRESS % str(e).encode("utf-8", "replace")
+
+
+def is_good_log_buffer(_buffer, _offset, count):
+    """校验 _offset 处是否为连续 count 条合法日志帧的起点。
+
+    迭代遍历帧链，直接用 unpack_from 在原 buffer 上取长度字段，
+    不产生子切片和递归栈帧。
+    """
+    # 热循环：把重复的全局/属性查找绑定为局部变量
+    buffer_len = len(_buffer)
+    u32_unpack_from = _U32.unpack_from
+    crypt_key_len_table = _CRYPT_KEY_LEN_TABLE
+    while count > 0:
+        if _offset == buffer_len:
+            return (True, '')
+
+        magic_start = _buffer[_offset]
+        crypt_key_len = crypt_key_len_table[magic_start]
+        if crypt_key_len == 0:
+            return (False, '_buffer[%d]:%d != MAGIC_NUM_START' % (_offset, magic_start))
+
+        header_len = 1 + 2 + 1 + 1 + 4 + crypt_key_len
+        if _offset + header_len + 1 + 1 > buffer_len:
+            return (False, 'offset:%d > len(buffer):%d' % (_offset, buffer_len))
+
+        length = u32_unpack_from(_buffer, _offset + header_len - 4 - crypt_key_len)[0]
+        if _offset + header_len + length + 1 > buffer_len:
+            return (False, 'log length:%d, end pos %d > len(buffer):%d'
+                    % (length, _offset + header_len + length + 1, buffer_len))
+
+        magic_end = _buffer[_offset + header_len + length]
+        if MAGIC_END != magic_end:
+            return (False, 'log length:%d, buffer[%d]:%d != MAGIC_END'
+                    % (length, _offset + header_len + length, magic_end))
+
+        _offset = _offset + header_len + length + 1
+        count -= 1
+
+    return (True, '')
+
+
+def get_log_start_pos(_buffer, _count):
+    """在 _buffer 中查找第一个合法的日志帧起始位置，找不到返回 -1。
+
+    候选位置用 _MAGIC_RE 在 C 层定位（以前的 translate+find 要先整体
+    复制一份 buffer，正则直接原地扫描）。
+    """
+    search = _MAGIC_RE.search
+    # 先做便宜的单帧校验，通过后才花钱确认整条帧链；
+    # 帧链确认失败的位置记下来兜底——损坏文件里对齐正确但下一帧
+    # 已损坏是常态，这时单帧命中仍是最佳起点
+    single_frame_pos = -1
+    match = search(_buffer)
+    while match:
+        pos = match.start()
+        if is_good_log_buffer(_buffer, pos, 1)[0]:
+            if _count <= 1 or is_good_log_buffer(_buffer, pos, _count)[0]:
+                return pos
+            if single_frame_pos == -1:
+                single_frame_pos = pos
+        match = search(_buffer, pos + 1)
+    return single_frame_pos
+
+
+def decode_buffer(_buffer, _offset, _fpout, _state):
+    """解码 _offset 处的一条日志帧并写入 _fpout，返回下一帧的偏移。
+
+    帧损坏时先通过 get_log_start_pos 重新同步；彻底失败返回 -1。
+    """
+    if _offset >= len(_buffer):
+        return -1
+
+    ret = is_good_log_buffer(_buffer, _offset, 1)
+    if not ret[0]:
+        # 在剩余部分中重新同步；memoryview 避免复制整个文件尾部
+        fixpos = get_log_start_pos(memoryview(_buffer)[_offset:], 1)
+        if -1 == fixpos:
+            return -1
+        _fpout.write(_ERR_DECODE % (fixpos, ret[1].encode("utf-8")))
+        _offset += fixpos
+
+    magic_start = _buffer[_offset]
+    crypt_key_len = _CRYPT_KEY_LEN_TABLE[magic_start]
+    if crypt_key_len == 0:
+        _fpout.write(_ERR_MAGIC % magic_start)
+        return -1
+
+    header_len = 1 + 2 + 1 + 1 + 4 + crypt_key_len
+    # length 字段起点，seq/hour 都在它前面，算一次基址即可
+    length_pos = _offset + header_len - 4 - crypt_key_len
+    length = _U32.unpack_from(_buffer, length_pos)[0]
+
+    # 1-2 字节的小字段直接按下标取，比走 struct 调度更快
+    seq_pos = length_pos - 2 - 2
+    seq = _buffer[seq_pos] | (_buffer[seq_pos + 1] << 8)
+    begin_hour = _buffer[length_pos - 1 - 1]
+    end_hour = _buffer[length_pos - 1]
+
+    lastseq = _state.lastseq
+    if seq != 0 and seq != 1 and lastseq != 0 and seq != (lastseq + 1):
+        _fpout.write(_ERR_SEQ_MISSING % (lastseq + 1, seq - 1))
+    if seq != 0:
+        _state.lastseq = seq
+
+    # 载荷不复制，直接以 memoryview 引用源 buffer；zlib 接受任何 buffer 协议对象
+    payload = memoryview(_buffer)[_offset + header_len:_offset + header_len + length]
+    tmpbuffer = payload
+
+    try:
+        if MAGIC_NO_COMPRESS_START1 == magic_start \
+                or MAGIC_COMPRESS_START2 == magic_start \
+                or MAGIC_SYNC_ZSTD_START == magic_start \
+                or MAGIC_ASYNC_ZSTD_START == magic_start:
+            # 加密格式，本脚本不持有私钥，无法解码
+            print_utf8("encrypted xlog, use the decode script with the private key")
+            tmpbuffer = b""
+        elif MAGIC_COMPRESS_START == magic_start \
+                or MAGIC_COMPRESS_NO_CRYPT_START == magic_start:
+            # 整帧解压交给工作线程，主线程立即去校验下一帧帧头
+            _fpout.submit(_inflate_frame, payload)
+            return _offset + header_len + length + 1
+        elif MAGIC_COMPRESS_START1 == magic_start:
+            # 用游标遍历 [2字节长度][数据] 子块，逐块喂给同一个解压器，
+            # 避免中间 bytearray 拼接和每次迭代的 O(N) 尾部搬移
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            parts = []
+            mv = payload
+            pos = 0
+            while pos < len(mv):
+                single_log_len = _U16.unpack_from(mv, pos)[0]
+                parts.append(decompressor.decompress(bytes(mv[pos + 2:pos + 2 + single_log_len])))
+                pos += 2 + single_log_len
+            tmpbuffer = b"".join(parts) + decompressor.flush()
+        elif MAGIC_SYNC_NO_CRYPT_ZSTD_START == magic_start \
+                or MAGIC_ASYNC_NO_CRYPT_ZSTD_START == magic_start:
+            if _ZSTD_DECOMPRESSOR is not None:
+                try:
+                    tmpbuffer = _ZSTD_DECOMPRESSOR.decompress(bytes(payload))
+                except zstandard.ZstdError:
+                    # 帧头未记录解压后大小时退回流式接口
+                    tmpbuffer = _ZSTD_DECOMPRESSOR.decompressobj().decompress(bytes(payload))
+            else:
+                print_utf8("zstd compressed xlog, install the optional"
+                           " zstandard package to decode, skip")
+                tmpbuffer = b""
+        # 其余 magic 为未压缩内容，直接输出
+    except Exception as e:
+        global _decompress_err_count
+        if _decompress_err_count < _DECOMPRESS_ERR_LIMIT:
+            _decompress_err_count += 1
+            traceback.print_exc()
+        _fpout.write(_ERR_DECOMPRESS % str(e).encode("utf-8", "replace"))
+        return _offset + header_len + length + 1
+
+    _fpout.write(tmpbuffer)
+    return _offset + header_len + length + 1
+
+
+def parse_mars_xlog_file(file_path, output_file):
+    """解码一个 Mars 格式的 xlog 文件，成功返回 True。"""
+    # 映射整个文件而不是整体读入堆内存：按需换页，峰值内存减半，
+    # 下游的索引/切片/memoryview 操作对 mmap 同样适用
+    with open(file_path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return False
+        _buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        # 单次线性遍历：从第一个合法帧开始解码，途中遇到损坏由
+        # decode_buffer 内部的 get_log_start_pos 原地重新同步。
+        # 以前对每个候选起点从头整解一遍文件，损坏多时是 O(N*K)，
+        # 且 except/continue 会吞掉真正的 bug
+        pos = get_log_start_pos(_buffer, 1)
+        if -1 == pos:
+            return False
+
+        # 边解码边写盘，峰值内存从解码总量降到单帧；
+        # 1MB 写缓冲把小帧的 write 聚合成大块 IO。
+        # 先写临时文件，成功后原子改名，中途失败不会留下半截输出，
+        # 也不会覆盖上一次成功解码的结果
+        tmp_output = output_file + ".tmp"
+        try:
+            state = DecodeState()
+            with open(tmp_output, "wb", buffering=1 << 20) as fpout, \
+                    ThreadPoolExecutor(max_workers=2) as pool:
+                writer = FrameWriter(fpout, pool)
+                while -1 != pos:
+                    pos = decode_buffer(_buffer, pos, writer, state)
+                writer.flush()
+                written = fpout.tell()
+
+            if written > 0:
+                os.replace(tmp_output, output_file)
+                return True
+            return False
+        finally:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+    finally:
+        _buffer.close()
+
+
+def _probe_format(file_path):
+    """读取文件头 4 字节，返回 "zip" / "xlog_v2" / "xlog_v3" / "unknown"。
+
+    原来 is_zip_file / is_mars_xlog_v2 / is_mars_xlog_v3 各自 open 一次
+    读同样的前几个字节，每个文件要做三组 open/read/close 系统调用，
+    目录批量处理时很浪费，这里合并为一次探测。
+    """
+    with open(file_path, "rb") as fp:
+        head = fp.read(4)
+    if head == b"PK\x03\x04":
+        return "zip"
+    if head:
+        crypt_key_len = _CRYPT_KEY_LEN_TABLE[head[0]]
+        if crypt_key_len == 4:
+            return "xlog_v2"
+        if crypt_key_len != 0:
+            return "xlog_v3"
+    return "unknown"
+
+
+def is_zip_file(file_path):
+    """检查文件是否为 ZIP 格式。"""
+    return _probe_format(file_path) == "zip"
+
+
+def is_mars_xlog_v2(file_path):
+    """检查文件是否为 Mars V2 格式的 xlog。"""
+    return _probe_format(file_path) == "xlog_v2"
+
+
+def is_mars_xlog_v3(file_path):
+    """检查文件是否为 Mars V3 格式的 xlog。"""
+    return _probe_format(file_path) == "xlog_v3"
+
+
+def decode_zipfile(file_path, output_file):
+    """解压 ZIP 格式的 xlog 文件，把所有成员拼接为一个日志文件。
+
+    成员通过 zip_ref.open 流式解压，直接拷贝到输出文件，
+    不再经过临时目录落盘后重读。
+    """
+    with zipfile.ZipFile(file_path, "r") as zip_ref, \
+            open(output_file, "wb", buffering=1 << 20) as outfile:
+        for info in sorted(zip_ref.infolist(), key=lambda i: i.filename):
+            if info.is_dir():
+                continue
+            with zip_ref.open(info) as infile:
+                shutil.copyfileobj(infile, outfile, 1 << 20)
+            outfile.write(b"\n")
+    return True
+
+
+def decode_xlog(file_path):
+    """解码单个 xlog 文件，返回输出文件路径；无法识别时返回 None。"""
+    dir_name, base_name = os.path.split(file_path)
+    stem = base_name.rsplit(".", 1)[0]
+    output_file = os.path.join(dir_name, stem + "_.log")
+
+    file_format = _probe_format(file_path)
+    if file_format in ("xlog_v2", "xlog_v3"):
+        ok = parse_mars_xlog_file(file_path, output_file)
+    elif file_format == "zip":
+        ok = decode_zipfile(file_path, output_file)
+    else:
+        print_utf8("unsupported file format: %s" % file_path)
+        return None
+
+    if not ok:
+        print_utf8("decode failed: %s" % file_path)
+        return None
+    # 与 rxd 的输出保持一致，便于上层统一解析
+    print_utf8("Successfully extracted: %s" % output_file)
+    return output_file
+
+
+def process_directory(dir_path):
+    """递归解码目录下的所有 xlog 文件，返回输出文件路径列表。
+
+    文件之间相互独立（lastseq 在每个文件解码前重置，子进程各有一份
+    模块状态），按 CPU 核数并行解码。
+    """
+    # 迭代式 scandir 遍历：不额外 stat，不拼接路径字符串，
+    # 对混杂大量非日志文件的目录明显快于 os.walk + splitext
+    paths = []
+    suffixes = (".xlog", ".mmap3", ".XLOG", ".MMAP3")
+    stack = [dir_path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) \
+                        and entry.name.endswith(suffixes):
+                    paths.append(entry.path)
+
+    processed_files = []
+    if len(paths) <= 1:
+        # 单个文件不值得承担进程池的启动开销
+        for path in paths:
+            output_file = decode_xlog(path)
+            if output_file:
+                processed_files.append(output_file)
+        return processed_files
+
+    with ProcessPoolExecutor() as executor:
+        futures = {executor.submit(decode_xlog, path): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                output_file = future.result()
+            except Exception:
+                traceback.print_exc()
+                continue
+            if output_file:
+                processed_files.append(output_file)
+    return processed_files
+
+
+def main():
+    if len(sys.argv) < 2:
+        print_utf8("usage: python3 decode_xlog.py <xlog file or directory>")
+        sys.exit(1)
+
+    target = sys.argv[1]
+    if os.path.isdir(target):
+        processed_files = process_directory(target)
+        print_utf8("decoded %d file(s)" % len(processed_files))
+    elif os.path.isfile(target):
+        if decode_xlog(target) is None:
+            sys.exit(1)
+    else:
+        print_utf8("no such file or directory: %s" % target)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()